@@ -7,13 +7,29 @@ LICENSE file in the root directory of this source tree.
 
 from __future__ import annotations
 
-import math
+from functools import lru_cache
 
 import torch
 from e3nn.o3 import FromS2Grid, ToS2Grid
 
 
-class CoefficientMapping(torch.nn.Module):
+class _RefreshOnApply(torch.nn.Module):
+    """
+    Base for modules keeping state derived from their buffers, e.g. lookup tables
+    of buffers. Buffers are replaced by `.to()` / `.cuda()` etc, so
+    `_refresh_after_apply()` rebuilds that state after every such conversion.
+    """
+
+    def _refresh_after_apply(self, fn) -> None:
+        raise NotImplementedError
+
+    def _apply(self, fn, *args, **kwargs):
+        super()._apply(fn, *args, **kwargs)
+        self._refresh_after_apply(fn)
+        return self
+
+
+class CoefficientMapping(_RefreshOnApply):
     """
     Helper module for coefficients used to reshape l <--> m and to get coefficients of specific degree or order
 
@@ -33,47 +49,56 @@ class CoefficientMapping(torch.nn.Module):
         self.lmax = lmax
         self.mmax = mmax
         # Compute the degree (l) and order (m) for each entry of the embedding
-        l_harmonic = torch.tensor([]).long()
-        m_harmonic = torch.tensor([]).long()
-        m_complex = torch.tensor([]).long()
-
-        for l in range(self.lmax + 1):
-            mmax = min(self.mmax, l)
-            m = torch.arange(-mmax, mmax + 1).long()
-            m_complex = torch.cat([m_complex, m], dim=0)
-            m_harmonic = torch.cat([m_harmonic, torch.abs(m).long()], dim=0)
-            l_harmonic = torch.cat([l_harmonic, m.fill_(l).long()], dim=0)
+        l_range = torch.arange(self.lmax + 1)
+        m_range = torch.clamp(l_range, max=self.mmax)
+        m_counts = 2 * m_range + 1
+        l_harmonic = torch.repeat_interleave(l_range, m_counts)
+        # offset of each coefficient within its degree, shifted to [-m_range, m_range]
+        block_start = torch.cumsum(m_counts, dim=0) - m_counts
+        m_complex = torch.arange(len(l_harmonic)) - torch.repeat_interleave(
+            block_start + m_range, m_counts
+        )
+        m_harmonic = torch.abs(m_complex)
         self.res_size = len(l_harmonic)
 
-        num_coefficients = len(l_harmonic)
-        # `self.to_m` moves m components from different L to contiguous index
-        to_m = torch.zeros([num_coefficients, num_coefficients])
-        self.m_size = torch.zeros([self.mmax + 1]).long().tolist()
-
-        offset = 0
-        for m in range(self.mmax + 1):
-            idx_r, idx_i = self.complex_idx(m, -1, m_complex, l_harmonic)
-
-            for idx_out, idx_in in enumerate(idx_r):
-                to_m[idx_out + offset, idx_in] = 1.0
-            offset = offset + len(idx_r)
-
-            self.m_size[m] = len(idx_r)
-
-            for idx_out, idx_in in enumerate(idx_i):
-                to_m[idx_out + offset, idx_in] = 1.0
-            offset = offset + len(idx_i)
-
-        to_m = to_m.detach()
+        # `self.to_m_index` moves m components from different L to contiguous index,
+        # ordered as m = 0, then the real (m) and imaginary (-m) parts of each m > 0
+        m_values = torch.arange(self.mmax + 1)
+        m_order = torch.stack([m_values, -m_values], dim=1).flatten()[1:]
+        m_mask = m_complex.unsqueeze(0) == m_order.unsqueeze(1)
+        # row-major nonzero groups the coefficient indices by m_order
+        to_m_index = torch.nonzero(m_mask)[:, 1]
+        self.m_size = m_mask[m_order >= 0].sum(dim=1).tolist()
+        # gather indices are stored as int32 (accepted by index_select) to halve
+        # their memory traffic, the values are bounded by (lmax + 1) ** 2
+        to_m_index = to_m_index.int()
+        # inverse permutation, moves contiguous m components back to L ordering
+        to_l_index = torch.argsort(to_m_index).int()
 
         # save tensors and they will be moved to GPU
         self.register_buffer("l_harmonic", l_harmonic, persistent=False)
         self.register_buffer("m_harmonic", m_harmonic, persistent=False)
         self.register_buffer("m_complex", m_complex, persistent=False)
-        self.register_buffer("to_m", to_m, persistent=False)
+        self.register_buffer("to_m_index", to_m_index, persistent=False)
+        self.register_buffer("to_l_index", to_l_index, persistent=False)
+        # dtype of the dense `to_m`, a float buffer in earlier versions
+        self.to_m_dtype = torch.get_default_dtype()
 
         self.pre_compute_coefficient_idx()
 
+    @property
+    def to_m(self) -> torch.Tensor:
+        """
+        Dense permutation matrix equivalent to `to_m_index`, materialized on access
+        in `to_m_dtype`, which follows `.double()` / `.half()` etc like a buffer.
+        Prefer the index buffers: `einsum("nac,ba->nbc", x, to_m)` is
+        `x.index_select(1, to_m_index)` and `einsum("nac,ab->nbc", x, to_m)` is
+        `x.index_select(1, to_l_index)`.
+        """
+        return torch.nn.functional.one_hot(
+            self.to_m_index.long(), len(self.to_m_index)
+        ).to(self.to_m_dtype)
+
     # Return mask containing coefficients of order m (real and imaginary parts)
     def complex_idx(self, m, lmax, m_complex, l_harmonic):
         """
@@ -105,57 +130,58 @@ class CoefficientMapping(torch.nn.Module):
             for m in range(lmax + 1):
                 mask = torch.bitwise_and(self.l_harmonic.le(l), self.m_harmonic.le(m))
                 indices = torch.arange(len(mask))
-                mask_indices = torch.masked_select(indices, mask)
+                mask_indices = torch.masked_select(indices, mask).int()
                 self.register_buffer(
                     f"coefficient_idx_l{l}_m{m}", mask_indices, persistent=False
                 )
+        self._build_coefficient_idx_lut()
+
+    def _build_coefficient_idx_lut(self):
+        # nested list of the `coefficient_idx_l*_m*` buffers so that `coefficient_idx()`
+        # avoids string formatting and attribute lookups on every call
+        self._coefficient_idx_lut = [
+            [self._buffers[f"coefficient_idx_l{l}_m{m}"] for m in range(self.lmax + 1)]
+            for l in range(self.lmax + 1)
+        ]
+
+    def _refresh_after_apply(self, fn) -> None:
+        self._build_coefficient_idx_lut()
+        self.to_m_dtype = fn(torch.empty(0, dtype=self.to_m_dtype)).dtype
 
     def prepare_coefficient_idx(self):
         """
-        Construct a list of buffers
+        Return the nested list of buffers, built once in `pre_compute_coefficient_idx()`
         """
-        lmax = self.lmax
-        coefficient_idx_list = []
-        for l in range(lmax + 1):
-            l_list = []
-            for m in range(lmax + 1):
-                l_list.append(getattr(self, f"coefficient_idx_l{l}_m{m}", None))
-            coefficient_idx_list.append(l_list)
-        return coefficient_idx_list
+        return self._coefficient_idx_lut
 
     # Return mask containing coefficients less than or equal to degree (l) and order (m)
     def coefficient_idx(self, lmax: int, mmax: int):
         if lmax > self.lmax or mmax > self.lmax:
             mask = torch.bitwise_and(self.l_harmonic.le(lmax), self.m_harmonic.le(mmax))
-            indices = torch.arange(len(mask), device=mask.device)
-            return torch.masked_select(indices, mask)
+            return torch.nonzero(mask).squeeze(1).int()
         else:
-            temp = self.prepare_coefficient_idx()
-            return temp[lmax][mmax]
+            return self._coefficient_idx_lut[lmax][mmax]
 
     def pre_compute_rotate_inv_rescale(self):
+        """
+        Pre-compute the per-row rescale factors of the inverse rotation for each
+        (l, m). The Wigner matrices are block diagonal in the degree, so rescaling
+        each block only scales its rows: `wigner_inv * rotate_inv_rescale` becomes
+        `wigner_inv * rotate_inv_rescale_diag_l{l}_m{m}.view(1, -1, 1)`.
+        """
         lmax = self.lmax
         for l in range(lmax + 1):
+            l_range = torch.arange(l + 1)
+            l_sub = torch.repeat_interleave(l_range, 2 * l_range + 1)
             for m in range(lmax + 1):
-                mask_indices = self.coefficient_idx(l, m)
-                rotate_inv_rescale = torch.ones(
-                    (1, int((l + 1) ** 2), int((l + 1) ** 2))
+                rotate_inv_rescale_diag = torch.where(
+                    l_sub > m,
+                    torch.sqrt((2 * l_sub + 1) / (2 * m + 1)),
+                    torch.ones(len(l_sub)),
                 )
-                for l_sub in range(l + 1):
-                    if l_sub <= m:
-                        continue
-                    start_idx = l_sub**2
-                    length = 2 * l_sub + 1
-                    rescale_factor = math.sqrt(length / (2 * m + 1))
-                    rotate_inv_rescale[
-                        :,
-                        start_idx : (start_idx + length),
-                        start_idx : (start_idx + length),
-                    ] = rescale_factor
-                rotate_inv_rescale = rotate_inv_rescale[:, :, mask_indices]
                 self.register_buffer(
-                    f"rotate_inv_rescale_l{l}_m{m}",
-                    rotate_inv_rescale,
+                    f"rotate_inv_rescale_diag_l{l}_m{m}",
+                    rotate_inv_rescale_diag,
                     persistent=False,
                 )
 
@@ -163,13 +189,18 @@ class CoefficientMapping(torch.nn.Module):
         return f"{self.__class__.__name__}(lmax={self.lmax}, mmax={self.mmax})"
 
 
-class SO3_Grid(torch.nn.Module):
+class SO3_Grid(_RefreshOnApply):
     """
     Helper functions for grid representation of the irreps
 
     Args:
         lmax (int):   Maximum degree of the spherical harmonics
         mmax (int):   Maximum order of the spherical harmonics
+        compute_dtype (torch.dtype): Optional reduced precision (e.g. torch.bfloat16)
+            of the grid matrices and of the matmuls in `to_grid()` / `from_grid()`,
+            outputs are cast back to the input dtype. None keeps the input dtype.
+        fp32_fallback_lmax (int): Ignore `compute_dtype` from this lmax on, where the
+            reduced precision transforms drift noticeably
     """
 
     def __init__(
@@ -179,10 +210,13 @@ class SO3_Grid(torch.nn.Module):
         normalization: str = "integral",
         resolution: int | None = None,
         rescale: bool = True,
+        compute_dtype: torch.dtype | None = None,
+        fp32_fallback_lmax: int = 12,
     ):
         super().__init__()
         self.lmax = lmax
         self.mmax = mmax
+        self.compute_dtype = compute_dtype if lmax < fp32_fallback_lmax else None
         self.lat_resolution = 2 * (self.lmax + 1)
         if lmax == mmax:
             self.long_resolution = 2 * (self.mmax + 1) + 1
@@ -195,54 +229,138 @@ class SO3_Grid(torch.nn.Module):
         self.mapping = CoefficientMapping(self.lmax, self.lmax)
         self.rescale = rescale
 
+        # rescale based on mmax, one factor per coefficient of degree l > mmax
+        coefficient_scale = torch.ones(len(self.mapping.l_harmonic))
+        if rescale and lmax != mmax:
+            l_harmonic = self.mapping.l_harmonic
+            coefficient_scale = torch.where(
+                l_harmonic > mmax,
+                torch.sqrt((2 * l_harmonic + 1) / (2 * mmax + 1)),
+                coefficient_scale,
+            )
+        coefficient_idx = self.mapping.coefficient_idx(self.lmax, self.mmax)
+        coefficient_scale = coefficient_scale[coefficient_idx]
+
         to_grid = ToS2Grid(
             self.lmax,
             (self.lat_resolution, self.long_resolution),
             normalization=normalization,  # normalization="integral",
         )
-        to_grid_mat = torch.einsum("mbi, am -> bai", to_grid.shb, to_grid.sha).detach()
-        # rescale based on mmax
-        if rescale and lmax != mmax:
-            for lval in range(lmax + 1):
-                if lval <= mmax:
-                    continue
-                start_idx = lval**2
-                length = 2 * lval + 1
-                rescale_factor = math.sqrt(length / (2 * mmax + 1))
-                to_grid_mat[:, :, start_idx : (start_idx + length)] = (
-                    to_grid_mat[:, :, start_idx : (start_idx + length)] * rescale_factor
-                )
-        to_grid_mat = to_grid_mat[
-            :, :, self.mapping.coefficient_idx(self.lmax, self.mmax)
-        ]
+        # "mbi, am -> bai" as a single (A, M) x (M, B * I) matmul
+        to_grid_mat = (
+            (to_grid.sha @ to_grid.shb.reshape(to_grid.shb.shape[0], -1))
+            .reshape(to_grid.sha.shape[0], *to_grid.shb.shape[1:])
+            .permute(1, 0, 2)
+            .detach()
+        )
+        to_grid_mat = to_grid_mat[:, :, coefficient_idx] * coefficient_scale
 
         from_grid = FromS2Grid(
             (self.lat_resolution, self.long_resolution),
             self.lmax,
             normalization=normalization,  # normalization="integral",
         )
-        from_grid_mat = torch.einsum(
-            "am, mbi -> bai", from_grid.sha, from_grid.shb
-        ).detach()
-        # rescale based on mmax
-        if rescale and lmax != mmax:
-            for lval in range(lmax + 1):
-                if lval <= mmax:
-                    continue
-                start_idx = lval**2
-                length = 2 * lval + 1
-                rescale_factor = math.sqrt(length / (2 * mmax + 1))
-                from_grid_mat[:, :, start_idx : (start_idx + length)] = (
-                    from_grid_mat[:, :, start_idx : (start_idx + length)]
-                    * rescale_factor
-                )
-        from_grid_mat = from_grid_mat[
-            :, :, self.mapping.coefficient_idx(self.lmax, self.mmax)
-        ]
+        # "am, mbi -> bai" as a single (A, M) x (M, B * I) matmul
+        from_grid_mat = (
+            (from_grid.sha @ from_grid.shb.reshape(from_grid.shb.shape[0], -1))
+            .reshape(from_grid.sha.shape[0], *from_grid.shb.shape[1:])
+            .permute(1, 0, 2)
+            .detach()
+        )
+        from_grid_mat = from_grid_mat[:, :, coefficient_idx] * coefficient_scale
 
         # save tensors and they will be moved to GPU
         self.register_buffer("to_grid_mat", to_grid_mat, persistent=False)
         self.register_buffer("from_grid_mat", from_grid_mat, persistent=False)
+        # flattened (lat * long) layouts so to_grid / from_grid are a single matmul
+        to_grid_mat_flat = to_grid_mat.reshape(-1, to_grid_mat.shape[-1]).contiguous()
+        from_grid_mat_flat = (
+            from_grid_mat.reshape(-1, from_grid_mat.shape[-1]).t().contiguous()
+        )
+        if self.compute_dtype is not None:
+            to_grid_mat_flat = to_grid_mat_flat.to(self.compute_dtype)
+            from_grid_mat_flat = from_grid_mat_flat.to(self.compute_dtype)
+        self.register_buffer("to_grid_mat_flat", to_grid_mat_flat, persistent=False)
+        self.register_buffer("from_grid_mat_flat", from_grid_mat_flat, persistent=False)
+        # buffers held in `compute_dtype`, the ones read by `_grid_matmul()`
+        self._compute_dtype_buffers = ["to_grid_mat_flat", "from_grid_mat_flat"]
+
+        self._grid_mat_lut = None
+        if self.lmax == self.mmax:
+            self.pre_compute_grid_mat()
+
+    def pre_compute_grid_mat(self):
+        """
+        Pre-slice the flattened grid matrices for every (l, m <= l) so that
+        `to_grid()` and `from_grid()` avoid a gather on every call.
+        Orders m > l select the same coefficients as m = l.
+        """
+        for l in range(self.lmax + 1):
+            for m in range(l + 1):
+                mask_indices = self.mapping.coefficient_idx(l, m)
+                self.register_buffer(
+                    f"to_grid_mat_l{l}_m{m}",
+                    self.to_grid_mat_flat[:, mask_indices].contiguous(),
+                    persistent=False,
+                )
+                self.register_buffer(
+                    f"from_grid_mat_l{l}_m{m}",
+                    self.from_grid_mat_flat[mask_indices, :].contiguous(),
+                    persistent=False,
+                )
+                self._compute_dtype_buffers += [
+                    f"to_grid_mat_l{l}_m{m}",
+                    f"from_grid_mat_l{l}_m{m}",
+                ]
+        self._build_grid_mat_lut()
+
+    def _build_grid_mat_lut(self):
+        # nested lists of the `to/from_grid_mat_l*_m*` buffers, indexed as [l][m]
+        self._grid_mat_lut = (
+            [
+                [self._buffers[f"to_grid_mat_l{l}_m{m}"] for m in range(l + 1)]
+                for l in range(self.lmax + 1)
+            ],
+            [
+                [self._buffers[f"from_grid_mat_l{l}_m{m}"] for m in range(l + 1)]
+                for l in range(self.lmax + 1)
+            ],
+        )
+
+    def _refresh_after_apply(self, fn) -> None:
+        if self.compute_dtype is not None:
+            # `.float()` / `.to(dtype)` etc also convert these, keep them reduced
+            for name in self._compute_dtype_buffers:
+                self._buffers[name] = self._buffers[name].to(self.compute_dtype)
+        if self._grid_mat_lut is not None:
+            self._build_grid_mat_lut()
+
+    @classmethod
+    def get_or_create(
+        cls,
+        lmax: int,
+        mmax: int,
+        normalization: str = "integral",
+        resolution: int | None = None,
+        rescale: bool = True,
+        compute_dtype: torch.dtype | None = None,
+        fp32_fallback_lmax: int = 12,
+    ) -> SO3_Grid:
+        """
+        Return a shared SO3_Grid for these arguments, constructing it only once.
+        The grid holds no parameters, but moving the shared instance with `.to()`
+        moves it for every holder, so only share it between modules that live on
+        the same device and dtype.
+        """
+        return _get_cached_so3_grid(
+            lmax,
+            mmax,
+            normalization,
+            resolution,
+            rescale,
+            compute_dtype,
+            fp32_fallback_lmax,
+        )
 
     # Compute matrices to transform irreps to grid
     def get_to_grid_mat(self, device=None):
@@ -252,14 +370,85 @@ class SO3_Grid(torch.nn.Module):
     def get_from_grid_mat(self, device=None):
         return self.from_grid_mat
 
+    def _get_grid_mat_flat(self, slot: int, dim: int, lmax: int, mmax: int):
+        # `slot` 0 / 1 selects the to / from grid matrix, whose coefficients
+        # run along `dim`
+        if lmax == self.lmax and mmax == self.mmax:
+            return (self.to_grid_mat_flat, self.from_grid_mat_flat)[slot]
+        if self._grid_mat_lut is not None and lmax <= self.lmax and mmax <= self.lmax:
+            return self._grid_mat_lut[slot][lmax][min(lmax, mmax)]
+        grid_mat_flat = (self.to_grid_mat_flat, self.from_grid_mat_flat)[slot]
+        return grid_mat_flat.index_select(dim, self.mapping.coefficient_idx(lmax, mmax))
+
+    def _grid_matmul(self, mat, x, channel_tile: int = 0):
+        dtype = x.dtype
+        if self.compute_dtype is not None and dtype != self.compute_dtype:
+            mat, x = mat.to(self.compute_dtype), x.to(self.compute_dtype)
+        num_channels = x.shape[-1]
+        if channel_tile <= 0 or num_channels <= channel_tile:
+            return torch.matmul(mat, x).to(dtype)
+        # block over channels so each matmul's operands stay cache resident
+        out = x.new_empty((x.shape[0], mat.shape[0], num_channels))
+        for c0 in range(0, num_channels, channel_tile):
+            c1 = min(c0 + channel_tile, num_channels)
+            out[..., c0:c1] = torch.matmul(mat, x[..., c0:c1])
+        return out.to(dtype)
+
     # Compute grid from irreps representation
-    def to_grid(self, embedding, lmax: int, mmax: int):
-        to_grid_mat = self.to_grid_mat[:, :, self.mapping.coefficient_idx(lmax, mmax)]
-        return torch.einsum("bai, zic -> zbac", to_grid_mat, embedding)
+    def to_grid(self, embedding, lmax: int, mmax: int, channel_tile: int = 0):
+        to_grid_mat = self._get_grid_mat_flat(0, 1, lmax, mmax)
+        # (B * A, I) x (Z, I, C) -> (Z, B * A, C)
+        grid = self._grid_matmul(to_grid_mat, embedding, channel_tile)
+        return grid.view(
+            embedding.shape[0],
+            self.to_grid_mat.shape[0],
+            self.to_grid_mat.shape[1],
+            embedding.shape[-1],
+        )
 
     # Compute irreps from grid representation
-    def from_grid(self, grid, lmax: int, mmax: int):
-        from_grid_mat = self.from_grid_mat[
-            :, :, self.mapping.coefficient_idx(lmax, mmax)
-        ]
-        return torch.einsum("bai, zbac -> zic", from_grid_mat, grid)
+    def from_grid(self, grid, lmax: int, mmax: int, channel_tile: int = 0):
+        from_grid_mat = self._get_grid_mat_flat(1, 0, lmax, mmax)
+        # (I, B * A) x (Z, B * A, C) -> (Z, I, C)
+        return self._grid_matmul(
+            from_grid_mat,
+            grid.reshape(grid.shape[0], -1, grid.shape[-1]),
+            channel_tile,
+        )
+
+    def apply_on_grid(self, embedding, fn, lmax: int, mmax: int, channel_tile: int = 0):
+        """
+        Project `embedding` to the grid, apply `fn` and project back to irreps,
+        i.e. `from_grid(fn(to_grid(embedding, lmax, mmax)), lmax, mmax)`.
+        `fn` receives a (Z, B, A, C) grid and must be stateless and point-wise over
+        grid points, e.g. an activation or an MLP over the channel dimension.
+        A positive `channel_tile` splits the matmuls of `to_grid()` and
+        `from_grid()` into blocks of that many channels to bound their working set.
+        """
+        return self.from_grid(
+            fn(self.to_grid(embedding, lmax, mmax, channel_tile)),
+            lmax,
+            mmax,
+            channel_tile,
+        )
+
+
+@lru_cache(maxsize=64)
+def _get_cached_so3_grid(
+    lmax: int,
+    mmax: int,
+    normalization: str,
+    resolution: int | None,
+    rescale: bool,
+    compute_dtype: torch.dtype | None,
+    fp32_fallback_lmax: int,
+) -> SO3_Grid:
+    return SO3_Grid(
+        lmax,
+        mmax,
+        normalization=normalization,
+        resolution=resolution,
+        rescale=rescale,
+        compute_dtype=compute_dtype,
+        fp32_fallback_lmax=fp32_fallback_lmax,
+    )
@@ -287,11 +287,9 @@ class eSCNMDBackbone(nn.Module, MOLEInterface):
             wigner = wigner.index_select(1, self.coefficient_index)
             wigner_inv = wigner_inv.index_select(2, self.coefficient_index)
 
-        wigner_and_M_mapping = torch.einsum(
-            "mk,nkj->nmj", self.mappingReduced.to_m, wigner
-        )
-        wigner_and_M_mapping_inv = torch.einsum(
-            "njk,mk->njm", wigner_inv, self.mappingReduced.to_m
+        wigner_and_M_mapping = wigner.index_select(1, self.mappingReduced.to_m_index)
+        wigner_and_M_mapping_inv = wigner_inv.index_select(
+            2, self.mappingReduced.to_m_index
         )
         return edge_rot_mat, wigner_and_M_mapping, wigner_and_M_mapping_inv
 
@@ -69,7 +69,7 @@ class Edgewise(torch.nn.Module):
                 lmax=self.lmax,
                 mmax=self.mmax,
                 SO3_grid=self.SO3_grid,
-                to_m=self.mappingReduced.to_m,
+                to_m_index=self.mappingReduced.to_m_index,
             )
             extra_m0_output_channels = self.hidden_channels
         else:
@@ -278,13 +278,11 @@ class GridAtomwise(torch.nn.Module):
         )
 
     def forward(self, x):
-        # Project to grid
-        x_grid = self.SO3_grid["lmax_lmax"].to_grid(x, self.lmax, self.lmax)
-        # Perform point-wise operations
-        x_grid = self.grid_mlp(x_grid)
-        # Project back to spherical harmonic coefficients
-        x = self.SO3_grid["lmax_lmax"].from_grid(x_grid, self.lmax, self.lmax)
-        return x
+        # Project to grid, perform point-wise operations and project back to
+        # spherical harmonic coefficients
+        return self.SO3_grid["lmax_lmax"].apply_on_grid(
+            x, self.grid_mlp, self.lmax, self.lmax
+        )
 
 
 class eSCNMD_Block(torch.nn.Module):
@@ -176,11 +176,9 @@ class S2Activation(torch.nn.Module):
         self.SO3_grid = SO3_grid
 
     def forward(self, inputs):
-        to_grid_mat = self.SO3_grid["lmax_mmax"].get_to_grid_mat()
-        from_grid_mat = self.SO3_grid["lmax_mmax"].get_from_grid_mat()
-        x_grid = torch.einsum("bai, zic -> zbac", to_grid_mat, inputs)
-        x_grid = self.act(x_grid)
-        return torch.einsum("bai, zbac -> zic", from_grid_mat, x_grid)
+        return self.SO3_grid["lmax_mmax"].apply_on_grid(
+            inputs, self.act, self.lmax, self.mmax
+        )
 
 
 class SeparableS2Activation(torch.nn.Module):
@@ -211,17 +209,22 @@ class S2Activation_M(torch.nn.Module):
     Assume we only have one resolution
     """
 
-    def __init__(self, lmax: int, mmax: int, SO3_grid, to_m: torch.Tensor) -> None:
+    def __init__(
+        self, lmax: int, mmax: int, SO3_grid, to_m_index: torch.Tensor
+    ) -> None:
         super().__init__()
         self.lmax = lmax
         self.mmax = mmax
         self.act = torch.nn.SiLU()
         self.SO3_grid = SO3_grid
+        # reorder the coefficient dimension of the grid matrices from l to m major
         to_grid_mat = self.SO3_grid["lmax_mmax"].get_to_grid_mat()
-        to_grid_mat_m = torch.einsum("ji,bai->jba", to_m, to_grid_mat)
-        self.register_buffer("to_grid_mat_m", to_grid_mat_m, persistent=False)
+        to_grid_mat_m = to_grid_mat.index_select(2, to_m_index).permute(2, 0, 1)
+        self.register_buffer(
+            "to_grid_mat_m", to_grid_mat_m.contiguous(), persistent=False
+        )
         from_grid_mat = self.SO3_grid["lmax_mmax"].get_from_grid_mat()
-        from_grid_mat_m = torch.einsum("ji,bai->baj", to_m, from_grid_mat)
+        from_grid_mat_m = from_grid_mat.index_select(2, to_m_index)
         self.register_buffer("from_grid_mat_m", from_grid_mat_m, persistent=False)
 
     def forward(self, inputs):
@@ -231,12 +234,12 @@ class S2Activation_M(torch.nn.Module):
 
 
 class SeparableS2Activation_M(torch.nn.Module):
-    def __init__(self, lmax: int, mmax: int, SO3_grid, to_m) -> None:
+    def __init__(self, lmax: int, mmax: int, SO3_grid, to_m_index) -> None:
         super().__init__()
         self.lmax = lmax
         self.mmax = mmax
         self.scalar_act = torch.nn.SiLU()
-        self.s2_act = S2Activation_M(self.lmax, self.mmax, SO3_grid, to_m)
+        self.s2_act = S2Activation_M(self.lmax, self.mmax, SO3_grid, to_m_index)
 
     def forward(self, input_scalars, input_tensors):
         output_scalars = self.scalar_act(input_scalars)
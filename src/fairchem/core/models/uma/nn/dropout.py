@@ -12,8 +12,16 @@ from __future__ import annotations
 
 import torch
 import torch.nn as nn
-import torch.nn.functional as F
-from e3nn import o3
+
+
+def _make_mask(x: torch.Tensor, shape, drop_prob: float) -> torch.Tensor:
+    # Bernoulli keep mask already scaled by 1 / keep_prob, drawn without an
+    # intermediate ones tensor
+    keep_prob = 1 - drop_prob
+    mask = x.new_empty(shape).bernoulli_(keep_prob)
+    if keep_prob > 0.0:
+        mask.div_(keep_prob)
+    return mask
 
 
 def drop_path(
@@ -28,23 +36,62 @@ def drop_path(
     """
     if drop_prob == 0.0 or not training:
         return x
-    keep_prob = 1 - drop_prob
     shape = (x.shape[0],) + (1,) * (
         x.ndim - 1
     )  # work with diff dim tensors, not just 2D ConvNets
-    random_tensor = keep_prob + torch.rand(shape, dtype=x.dtype, device=x.device)
-    random_tensor.floor_()  # binarize
-    return x.div(keep_prob) * random_tensor
+    return x * _make_mask(x, shape, drop_prob)
+
+
+def graph_drop_path(
+    x: torch.Tensor,
+    batch: torch.Tensor,
+    batch_size: int,
+    drop_prob: float = 0.0,
+    training: bool = False,
+) -> torch.Tensor:
+    """Drop paths (Stochastic Depth) per graph rather than per sample.
+    `batch` assigns each row of `x` to one of `batch_size` graphs.
+    """
+    if drop_prob == 0.0 or not training:
+        return x
+    shape = (batch_size,) + (1,) * (
+        x.ndim - 1
+    )  # work with diff dim tensors, not just 2D ConvNets
+    return x * _make_mask(x, shape, drop_prob)[batch]
+
+
+def _dropout_array_spherical_harmonics(
+    x: torch.Tensor,
+    drop_prob: float,
+    batch: torch.Tensor | None = None,
+    batch_size: int = 0,
+) -> torch.Tensor:
+    # one (1, C) mask broadcast over the spherical harmonics of each node,
+    # or of each graph if `batch` is given
+    if batch is None:
+        return x * _make_mask(x, (x.shape[0], 1, x.shape[2]), drop_prob)
+    return x * _make_mask(x, (batch_size, 1, x.shape[2]), drop_prob)[batch]
+
+
+# fused versions used by the modules below when `use_compile=True`
+_drop_path_compiled = torch.compile(drop_path, dynamic=True, fullgraph=True)
+_graph_drop_path_compiled = torch.compile(graph_drop_path, dynamic=True, fullgraph=True)
+_dropout_array_spherical_harmonics_compiled = torch.compile(
+    _dropout_array_spherical_harmonics, dynamic=True, fullgraph=True
+)
 
 
 class DropPath(nn.Module):
     """Drop paths (Stochastic Depth) per sample  (when applied in main path of residual blocks)."""
 
-    def __init__(self, drop_prob: float) -> None:
+    def __init__(self, drop_prob: float, use_compile: bool = False) -> None:
         super().__init__()
         self.drop_prob = drop_prob
+        self.use_compile = use_compile
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
+        if self.use_compile:
+            return _drop_path_compiled(x, self.drop_prob, self.training)
         return drop_path(x, self.drop_prob, self.training)
 
     def extra_repr(self) -> str:
@@ -56,18 +103,24 @@ class GraphDropPath(nn.Module):
     Consider batch for graph data when dropping paths.
     """
 
-    def __init__(self, drop_prob: float) -> None:
+    def __init__(self, drop_prob: float, use_compile: bool = False) -> None:
         super().__init__()
         self.drop_prob = drop_prob
+        self.use_compile = use_compile
 
-    def forward(self, x: torch.Tensor, batch) -> torch.Tensor:
-        batch_size = batch.max() + 1
-        shape = (batch_size,) + (1,) * (
-            x.ndim - 1
-        )  # work with diff dim tensors, not just 2D ConvNets
-        ones = torch.ones(shape, dtype=x.dtype, device=x.device)
-        drop = drop_path(ones, self.drop_prob, self.training)
-        return x * drop[batch]
+    def forward(
+        self, x: torch.Tensor, batch, batch_size: int | None = None
+    ) -> torch.Tensor:
+        if self.drop_prob == 0.0 or not self.training:
+            return x
+        if batch_size is None:
+            # device sync, avoided by passing `batch_size` (e.g. data.num_graphs)
+            batch_size = int(batch.max()) + 1
+        if self.use_compile:
+            return _graph_drop_path_compiled(
+                x, batch, batch_size, self.drop_prob, self.training
+            )
+        return graph_drop_path(x, batch, batch_size, self.drop_prob, self.training)
 
     def extra_repr(self) -> str:
         return f"drop_prob={self.drop_prob}"
@@ -79,18 +132,19 @@ class EquivariantDropout(nn.Module):
         self.irreps = irreps
         self.num_irreps = irreps.num_irreps
         self.drop_prob = drop_prob
-        self.drop = torch.nn.Dropout(drop_prob, True)
-        self.mul = o3.ElementwiseTensorProduct(
-            irreps, o3.Irreps(f"{self.num_irreps}x0e")
+        # index of the irrep each channel of `x` belongs to, expands a
+        # (N, num_irreps) mask over the 2l + 1 components of every irrep
+        repeat_index = torch.repeat_interleave(
+            torch.arange(self.num_irreps),
+            torch.tensor([ir.dim for mul, ir in irreps for _ in range(mul)]),
         )
+        self.register_buffer("repeat_index", repeat_index, persistent=False)
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         if not self.training or self.drop_prob == 0.0:
             return x
-        shape = (x.shape[0], self.num_irreps)
-        mask = torch.ones(shape, dtype=x.dtype, device=x.device)
-        mask = self.drop(mask)
-        return self.mul(x, mask)
+        mask = _make_mask(x, (x.shape[0], self.num_irreps), self.drop_prob)
+        return x * mask.index_select(-1, self.repeat_index)
 
 
 class EquivariantScalarsDropout(nn.Module):
@@ -98,50 +152,63 @@ class EquivariantScalarsDropout(nn.Module):
         super().__init__()
         self.irreps = irreps
         self.drop_prob = drop_prob
+        # (start, length) of the channel ranges of `x` belonging to scalar irreps,
+        # the only ones dropped, with adjacent scalar irreps merged into one range
+        self.scalar_slices = []
+        start_idx = 0
+        for mul, ir in self.irreps:
+            if ir.is_scalar():
+                if self.scalar_slices and sum(self.scalar_slices[-1]) == start_idx:
+                    start, length = self.scalar_slices[-1]
+                    self.scalar_slices[-1] = (start, length + mul * ir.dim)
+                else:
+                    self.scalar_slices.append((start_idx, mul * ir.dim))
+            start_idx += mul * ir.dim
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         if not self.training or self.drop_prob == 0.0:
             return x
-        out = []
-        start_idx = 0
-        for mul, ir in self.irreps:
-            temp = x.narrow(-1, start_idx, mul * ir.dim)
-            start_idx += mul * ir.dim
-            if ir.is_scalar():
-                temp = F.dropout(temp, p=self.drop_prob, training=self.training)
-            out.append(temp)
-        return torch.cat(out, dim=-1)
+        # one copy of `x`, then scale the scalar ranges in place
+        out = x.clone()
+        for start, length in self.scalar_slices:
+            mask = _make_mask(x, (x.shape[0], length), self.drop_prob)
+            out.narrow(-1, start, length).mul_(mask)
+        return out
 
     def extra_repr(self) -> str:
         return f"irreps={self.irreps}, drop_prob={self.drop_prob}"
 
 
 class EquivariantDropoutArraySphericalHarmonics(nn.Module):
-    def __init__(self, drop_prob: float, drop_graph: bool = False) -> None:
+    def __init__(
+        self, drop_prob: float, drop_graph: bool = False, use_compile: bool = False
+    ) -> None:
         super().__init__()
         self.drop_prob = drop_prob
-        self.drop = torch.nn.Dropout(drop_prob, True)
         self.drop_graph = drop_graph
+        self.use_compile = use_compile
 
-    def forward(self, x: torch.Tensor, batch=None) -> torch.Tensor:
+    def forward(
+        self, x: torch.Tensor, batch=None, batch_size: int | None = None
+    ) -> torch.Tensor:
         if not self.training or self.drop_prob == 0.0:
             return x
         assert len(x.shape) == 3
 
         if self.drop_graph:
             assert batch is not None
-            batch_size = batch.max() + 1
-            shape = (batch_size, 1, x.shape[2])
-            mask = torch.ones(shape, dtype=x.dtype, device=x.device)
-            mask = self.drop(mask)
-            out = x * mask[batch]
+            if batch_size is None:
+                # device sync, avoided by passing `batch_size` (e.g. data.num_graphs)
+                batch_size = int(batch.max()) + 1
         else:
-            shape = (x.shape[0], 1, x.shape[2])
-            mask = torch.ones(shape, dtype=x.dtype, device=x.device)
-            mask = self.drop(mask)
-            out = x * mask
-
-        return out
+            batch_size = 0
+            batch = None
+
+        if self.use_compile:
+            return _dropout_array_spherical_harmonics_compiled(
+                x, self.drop_prob, batch, batch_size
+            )
+        return _dropout_array_spherical_harmonics(x, self.drop_prob, batch, batch_size)
 
     def extra_repr(self) -> str:
         return f"drop_prob={self.drop_prob}, drop_graph={self.drop_graph}"
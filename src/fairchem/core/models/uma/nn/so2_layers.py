@@ -260,7 +260,7 @@ class SO2_Linear(torch.nn.Module):
         out = []
 
         # Reshape the spherical harmonics based on m (order)
-        x = torch.einsum("nac,ba->nbc", x, self.mappingReduced.to_m)
+        x = x.index_select(1, self.mappingReduced.to_m_index)
 
         # radial function
         if self.rad_func is not None:
@@ -304,5 +304,5 @@ class SO2_Linear(torch.nn.Module):
         out = torch.cat(out, dim=1)
 
         # Reshape the spherical harmonics based on l (degree)
-        out = torch.einsum("nac,ab->nbc", out, self.mappingReduced.to_m)
+        out = out.index_select(1, self.mappingReduced.to_l_index)
         return out
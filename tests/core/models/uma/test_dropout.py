@@ -0,0 +1,109 @@
+"""
+Copyright (c) Meta Platforms, Inc. and affiliates.
+
+This source code is licensed under the MIT license found in the
+LICENSE file in the root directory of this source tree.
+"""
+
+from __future__ import annotations
+
+import pytest
+import torch
+from e3nn import o3
+
+from fairchem.core.models.uma.nn.dropout import (
+    DropPath,
+    EquivariantDropout,
+    EquivariantDropoutArraySphericalHarmonics,
+    EquivariantScalarsDropout,
+    GraphDropPath,
+    _make_mask,
+)
+
+
+def test_equivariant_dropout_matches_tensor_product():
+    irreps = o3.Irreps("3x0e+2x1o+1x2e+2x0e")
+    dropout = EquivariantDropout(irreps, drop_prob=0.5)
+    x = torch.randn(64, irreps.dim)
+
+    torch.manual_seed(0)
+    out = dropout(x)
+    torch.manual_seed(0)
+    mask = _make_mask(x, (x.shape[0], irreps.num_irreps), 0.5)
+
+    mul = o3.ElementwiseTensorProduct(irreps, o3.Irreps(f"{irreps.num_irreps}x0e"))
+    assert torch.allclose(out, mul(x, mask), atol=1e-6)
+
+
+@pytest.mark.parametrize("use_compile", [False, True])
+@pytest.mark.parametrize("pass_batch_size", [False, True])
+def test_graph_drop_path_one_mask_per_graph(use_compile, pass_batch_size):
+    torch.manual_seed(0)
+    batch = torch.arange(50).repeat_interleave(4)
+    x = torch.ones(len(batch), 3, 2)
+    drop = GraphDropPath(0.5, use_compile=use_compile)
+    out = drop(x, batch, 50) if pass_batch_size else drop(x, batch)
+
+    per_graph = out.view(50, -1)
+    assert torch.equal(per_graph, per_graph[:, :1].expand_as(per_graph))
+    assert set(per_graph[:, 0].tolist()) == {0.0, 2.0}
+
+
+@pytest.mark.parametrize("pass_batch_size", [False, True])
+def test_dropout_array_spherical_harmonics_one_mask_per_graph(pass_batch_size):
+    torch.manual_seed(0)
+    batch = torch.arange(50).repeat_interleave(4)
+    x = torch.ones(len(batch), 9, 8)
+    dropout = EquivariantDropoutArraySphericalHarmonics(0.5, drop_graph=True)
+    out = dropout(x, batch, 50) if pass_batch_size else dropout(x, batch)
+
+    # one (1, C) mask per graph, shared by its nodes and spherical harmonics
+    per_graph = out.view(50, -1, 8)
+    assert torch.equal(per_graph, per_graph[:, :1].expand_as(per_graph))
+    assert set(per_graph.unique().tolist()) == {0.0, 2.0}
+
+
+def test_dropout_eval_returns_input():
+    irreps = o3.Irreps("2x0e+1x1o")
+    batch = torch.zeros(4, dtype=torch.long)
+    x = torch.randn(4, irreps.dim)
+    x_sh = torch.randn(4, 9, 3)
+    modules = [
+        DropPath(0.5),
+        EquivariantDropout(irreps, 0.5),
+        EquivariantScalarsDropout(irreps, 0.5),
+    ]
+    for module in modules:
+        module.eval()
+        assert module(x) is x
+    graph_drop = GraphDropPath(0.5).eval()
+    assert graph_drop(x, batch) is x
+    sh_dropout = EquivariantDropoutArraySphericalHarmonics(0.5, drop_graph=True).eval()
+    assert sh_dropout(x_sh, batch) is x_sh
+
+
+def test_drop_path_all_dropped_is_zero():
+    out = DropPath(1.0)(torch.randn(8, 3))
+    assert torch.equal(out, torch.zeros(8, 3))
+
+
+def test_equivariant_scalars_dropout_only_drops_scalars():
+    torch.manual_seed(0)
+    irreps = o3.Irreps("4x0e+2x1o+3x0e+1x2e")
+    dropout = EquivariantScalarsDropout(irreps, drop_prob=0.5)
+    x = torch.randn(1000, irreps.dim)
+    out = dropout(x)
+
+    is_scalar = torch.zeros(irreps.dim, dtype=torch.bool)
+    is_scalar[:4] = True
+    is_scalar[10:13] = True
+    # non-scalar channels pass through bit-exact
+    assert torch.equal(out[:, ~is_scalar], x[:, ~is_scalar])
+    # scalar channels are either dropped or rescaled by 1 / (1 - drop_prob)
+    scalars_out, scalars_in = out[:, is_scalar], x[:, is_scalar]
+    dropped = scalars_out == 0
+    assert dropped.any()
+    assert torch.allclose(scalars_out[~dropped], scalars_in[~dropped] * 2.0)
+
+    dropout.eval()
+    assert dropout(x) is x
@@ -0,0 +1,142 @@
+"""
+Copyright (c) Meta Platforms, Inc. and affiliates.
+
+This source code is licensed under the MIT license found in the
+LICENSE file in the root directory of this source tree.
+"""
+
+from __future__ import annotations
+
+import pytest
+import torch
+
+from fairchem.core.models.uma.common.so3 import CoefficientMapping, SO3_Grid
+
+
+@pytest.mark.parametrize(
+    ("lmax", "mmax"), [(l, m) for l in range(8) for m in range(l + 1)]
+)
+def test_coefficient_mapping(lmax, mmax):
+    mapping = CoefficientMapping(lmax, mmax)
+
+    # reference layout: for each degree l, orders -min(l, mmax) .. min(l, mmax)
+    l_harmonic, m_complex = [], []
+    for l in range(lmax + 1):
+        for m in range(-min(l, mmax), min(l, mmax) + 1):
+            l_harmonic.append(l)
+            m_complex.append(m)
+    assert mapping.l_harmonic.tolist() == l_harmonic
+    assert mapping.m_complex.tolist() == m_complex
+    assert mapping.m_harmonic.tolist() == [abs(m) for m in m_complex]
+    assert mapping.m_size == [lmax - m + 1 for m in range(mmax + 1)]
+
+    # reference m-major order: m = 0, then the +m and -m coefficients of each m > 0
+    to_m_index = []
+    for m in range(mmax + 1):
+        to_m_index += [i for i, mc in enumerate(m_complex) if mc == m]
+        if m > 0:
+            to_m_index += [i for i, mc in enumerate(m_complex) if mc == -m]
+    assert mapping.to_m_index.tolist() == to_m_index
+
+    x = torch.randn(3, len(l_harmonic), 4)
+    x_m = x.index_select(1, mapping.to_m_index)
+    assert torch.equal(x_m, torch.einsum("nac,ba->nbc", x, mapping.to_m))
+    assert torch.equal(x_m.index_select(1, mapping.to_l_index), x)
+
+    for l in range(lmax + 1):
+        for m in range(lmax + 1):
+            coefficient_idx = mapping.coefficient_idx(l, m)
+            assert coefficient_idx.dtype == torch.int32
+            assert coefficient_idx.tolist() == [
+                i
+                for i, (lh, mc) in enumerate(zip(l_harmonic, m_complex))
+                if lh <= l and abs(mc) <= m
+            ]
+
+
+def test_coefficient_mapping_to_m_follows_dtype():
+    mapping = CoefficientMapping(3, 2)
+    assert mapping.to_m.dtype == torch.float32
+    mapping.double()
+    x = torch.randn(3, mapping.res_size, 4, dtype=torch.float64)
+    x_m = torch.einsum("nac,ba->nbc", x, mapping.to_m)
+    assert torch.equal(x_m, x.index_select(1, mapping.to_m_index))
+
+
+@pytest.mark.parametrize("lmax", [2, 4, 6])
+def test_so3_grid_matches_einsum(lmax):
+    torch.manual_seed(0)
+    grid = SO3_Grid(lmax, lmax, resolution=18)
+    for l in range(lmax + 1):
+        for m in range(l + 1):
+            coefficient_idx = grid.mapping.coefficient_idx(l, m)
+            x = torch.randn(5, len(coefficient_idx), 7)
+
+            to_grid_mat = grid.to_grid_mat[:, :, coefficient_idx]
+            from_grid_mat = grid.from_grid_mat[:, :, coefficient_idx]
+            expected_grid = torch.einsum("bai, zic -> zbac", to_grid_mat, x)
+            expected_x = torch.einsum("bai, zbac -> zic", from_grid_mat, expected_grid)
+
+            x_grid = grid.to_grid(x, l, m)
+            assert torch.allclose(x_grid, expected_grid, atol=1e-5)
+            assert torch.allclose(grid.from_grid(x_grid, l, m), expected_x, atol=1e-5)
+
+
+def test_so3_grid_apply_on_grid():
+    torch.manual_seed(0)
+    lmax = 4
+    grid = SO3_Grid(lmax, lmax, resolution=18)
+    x = torch.randn(5, (lmax + 1) ** 2, 7)
+    expected = grid.from_grid(
+        torch.nn.functional.silu(grid.to_grid(x, lmax, lmax)), lmax, lmax
+    )
+    out = grid.apply_on_grid(x, torch.nn.functional.silu, lmax, lmax)
+    assert torch.allclose(out, expected, atol=1e-6)
+
+
+def test_so3_grid_get_or_create():
+    grid = SO3_Grid.get_or_create(2, 2, resolution=18)
+    assert SO3_Grid.get_or_create(2, 2, resolution=18) is grid
+    assert SO3_Grid.get_or_create(2, 1, resolution=18) is not grid
+
+    fallback = SO3_Grid.get_or_create(
+        2, 2, compute_dtype=torch.bfloat16, fp32_fallback_lmax=2
+    )
+    assert fallback.compute_dtype is None
+    assert SO3_Grid.get_or_create(2, 2, compute_dtype=torch.bfloat16) is not fallback
+
+
+def test_so3_grid_compute_dtype():
+    torch.manual_seed(0)
+    lmax = 4
+    grid = SO3_Grid(lmax, lmax, resolution=18)
+    grid_bf16 = SO3_Grid(lmax, lmax, resolution=18, compute_dtype=torch.bfloat16)
+    assert grid_bf16.to_grid_mat_flat.dtype == torch.bfloat16
+    x = torch.randn(5, (lmax + 1) ** 2, 7)
+    x_grid = grid_bf16.to_grid(x, lmax, lmax)
+    assert x_grid.dtype == torch.float32
+    assert torch.allclose(x_grid, grid.to_grid(x, lmax, lmax), atol=5e-2)
+
+    # module dtype conversions keep the grid matrices in compute_dtype
+    grid_bf16.float()
+    assert grid_bf16.to_grid_mat_flat.dtype == torch.bfloat16
+    assert grid_bf16.from_grid_mat_flat.dtype == torch.bfloat16
+    assert grid_bf16._get_grid_mat_flat(0, 1, 2, 1).dtype == torch.bfloat16
+    assert torch.equal(grid_bf16.to_grid(x, lmax, lmax), x_grid)
+
+    fallback = SO3_Grid(lmax, lmax, compute_dtype=torch.bfloat16, fp32_fallback_lmax=4)
+    assert fallback.compute_dtype is None
+    assert fallback.to_grid_mat_flat.dtype == torch.float32
+
+
+def test_so3_grid_channel_tile():
+    torch.manual_seed(0)
+    lmax = 4
+    grid = SO3_Grid(lmax, lmax, resolution=18)
+    x = torch.randn(5, (lmax + 1) ** 2, 70, requires_grad=True)
+    expected = grid.apply_on_grid(x, torch.nn.functional.silu, lmax, lmax)
+    (expected_grad,) = torch.autograd.grad(expected.sum(), x)
+    out = grid.apply_on_grid(x, torch.nn.functional.silu, lmax, lmax, channel_tile=16)
+    (grad,) = torch.autograd.grad(out.sum(), x)
+    assert torch.allclose(out, expected, atol=1e-5)
+    assert torch.allclose(grad, expected_grad, atol=1e-5)
@@ -39,19 +39,19 @@ def check_features_match(
     edge_index_1, cell_offsets_1, edge_index_2, cell_offsets_2
 ) -> bool:
     # Combine both edge indices and offsets to one tensor
-    features_1 = torch.cat((edge_index_1, cell_offsets_1.T), dim=0).T
+    features_1 = torch.cat((edge_index_1, cell_offsets_1.T), dim=0).T.long()
     features_2 = torch.cat((edge_index_2, cell_offsets_2.T), dim=0).T.long()
 
-    # Convert rows of tensors to sets. The order of edges is not guaranteed
-    features_1_set = {tuple(x.tolist()) for x in features_1}
-    features_2_set = {tuple(x.tolist()) for x in features_2}
+    # Reduce rows to sorted sets of unique rows. The order of edges is not guaranteed
+    features_1_set = torch.unique(features_1, dim=0)
+    features_2_set = torch.unique(features_2, dim=0)
 
     # Ensure sets are not empty
     assert len(features_1_set) > 0
     assert len(features_2_set) > 0
 
     # Ensure sets are the same
-    assert features_1_set == features_2_set
+    assert torch.equal(features_1_set, features_2_set)
 
     return True
 